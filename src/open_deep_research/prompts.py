@@ -510,4 +510,16 @@ Example 2 (for a scientific article):
 }}
 ```
 
-Remember, your goal is to create a summary that can be easily understood and utilized by a downstream research agent while preserving the most critical information from the original webpage."""
\ No newline at end of file
+Remember, your goal is to create a summary that can be easily understood and utilized by a downstream research agent while preserving the most critical information from the original webpage."""
+
+
+# Simple workflow prompts (simple_graph.py)
+simple_outline_instructions = """Create a research outline with exactly {number_of_sections} sections that cover the topic from different angles.
+For each section give a descriptive title, a short description of its scope, and {number_of_queries} focused search queries."""
+
+simple_section_summary_instructions = """Write a detailed, well-structured report section from the search results.
+Include the key facts and findings, stay objective, and cite important sources."""
+
+simple_final_report_instructions = """Write the framing for a professional research report built from the sections below:
+a compelling title, an executive summary of the key insights, and a conclusion that synthesizes the findings.
+Do not rewrite the sections; they are included in the report as-is."""
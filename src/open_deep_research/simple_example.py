@@ -20,6 +20,7 @@ async def run_simple_research(topic: str):
             "model_provider": "openai",
             "model_name": "gpt-4o",
             "search_api": "tavily",
+            "number_of_sections": 3,
             "number_of_queries_per_section": 3,
             "max_results_per_query": 5
         }
@@ -43,13 +44,13 @@ async def run_simple_research(topic: str):
         print(f"  • {section_name}: {description}")
     
     print("\n🔍 Queries Generated:")
-    for section_result in result["section_results"]:
+    for section_result in result["section_results"].values():
         print(f"  {section_result['section_name']}:")
         for i, query in enumerate(section_result['queries'], 1):
             print(f"    {i}. {query}")
     
     print("\n📝 Section Summaries Created:")
-    for section_result in result["section_results"]:
+    for section_result in result["section_results"].values():
         print(f"  ✅ {section_result['section_name']}")
     
     print("\n📄 Final Report:")
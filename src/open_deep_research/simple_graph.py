@@ -1,40 +1,72 @@
-from typing import List, Dict, Any, TypedDict, Annotated
-from dataclasses import dataclass
-from operator import add
+import asyncio
+import logging
+import os
+import uuid
+from typing import List, Dict, Any, Literal, Optional, TypedDict, Annotated
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from operator import or_
 
 from langchain.chat_models import init_chat_model
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 from pydantic import BaseModel, Field
 
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.constants import Send
 from langgraph.graph import START, END, StateGraph
 from langgraph.types import Command
 
-from open_deep_research.utils import select_and_execute_search
+from open_deep_research.prompts import (
+    simple_final_report_instructions,
+    simple_outline_instructions,
+    simple_section_summary_instructions,
+)
+from open_deep_research.utils import (
+    deduplicate_and_format_sources,
+    get_search_params,
+    select_and_execute_search,
+    tavily_search_async,
+)
 
 
-# Pydantic models for structured outputs
-class InitialSections(BaseModel):
-    """Three initial sections for the topic."""
-    section_1: str = Field(description="First section title and brief description")
-    section_2: str = Field(description="Second section title and brief description") 
-    section_3: str = Field(description="Third section title and brief description")
+logger = logging.getLogger(__name__)
 
-class SubQueries(BaseModel):
-    """Sub-queries for a section."""
-    queries: List[str] = Field(description="List of search queries for this section")
+# Number of streamed summary chunks forwarded to progress_callback at a time
+SUMMARY_STREAM_BATCH_SIZE = 16
+
+# Parameter each search API takes for its per-query result count; linkup,
+# duckduckgo, perplexity and azureaisearch accept none through get_search_params
+MAX_RESULTS_PARAMS = {
+    "tavily": "max_results",
+    "googlesearch": "max_results",
+    "exa": "num_results",
+    "arxiv": "load_max_docs",
+    "pubmed": "top_k_results",
+}
 
-class SectionSummary(BaseModel):
-    """Detailed summary for a section."""
+# Last queued progress update per (event loop, run); later updates of the run wait
+# on it to keep delivery in order, and it holds the strong reference the event
+# loop does not
+_progress_tails: dict[tuple[asyncio.AbstractEventLoop, str], asyncio.Task] = {}
+
+
+# Pydantic models for structured outputs
+class SectionPlan(BaseModel):
+    """A planned section and the search queries to research it."""
     title: str = Field(description="Section title")
-    summary: str = Field(description="Detailed summary based on retrieved content")
+    description: str = Field(description="Brief description of what the section covers")
+    queries: List[str] = Field(description="List of search queries for this section")
+
+class InitialSections(BaseModel):
+    """Initial sections for the topic."""
+    sections: List[SectionPlan] = Field(description="Planned sections and their search queries")
 
-class FinalReport(BaseModel):
-    """Final compiled report."""
+class ReportShell(BaseModel):
+    """Framing for the final report; the section bodies are added verbatim."""
     title: str = Field(description="Report title")
     executive_summary: str = Field(description="Executive summary of the report")
-    sections: List[Dict[str, str]] = Field(description="List of sections with title and content")
     conclusion: str = Field(description="Final conclusion")
 
 
@@ -43,7 +75,6 @@ class SectionResult(TypedDict):
     """Result from processing a single section."""
     section_name: str
     queries: List[str]
-    content: str
     summary: str
 
 
@@ -52,7 +83,9 @@ class SimpleReportState(TypedDict):
     """Main state for the simple report workflow."""
     topic: str
     initial_sections: Dict[str, str]  # section_name -> description
-    section_results: Annotated[List[SectionResult], add]  # List of section results with reducer
+    section_queries: Dict[str, List[str]]  # section_name -> search queries
+    section_results: Annotated[Dict[str, SectionResult], or_]  # section_name -> result, merged by reducer
+    progress_run_id: str  # keys this run's ordered progress updates
     final_report: str
 
 class SectionProcessingState(TypedDict):
@@ -60,6 +93,9 @@ class SectionProcessingState(TypedDict):
     topic: str
     section_name: str
     section_description: str
+    queries: List[str]
+    content: str
+    progress_run_id: str
 
 
 @dataclass(kw_only=True)
@@ -68,207 +104,347 @@ class SimpleWorkflowConfiguration:
     model_provider: str = "openai"
     model_name: str = "gpt-4o"
     search_api: str = "tavily"
+    number_of_sections: int = 3
     number_of_queries_per_section: int = 3
     max_results_per_query: int = 5
+    max_sources_per_section: int = 5
+    max_tokens_per_source: int = 1000
+
+    @classmethod
+    def from_runnable_config(
+        cls, config: Optional[RunnableConfig] = None
+    ) -> "SimpleWorkflowConfiguration":
+        """Create a SimpleWorkflowConfiguration instance from a RunnableConfig."""
+        configurable = (
+            config["configurable"] if config and "configurable" in config else {}
+        )
+        field_types = {f.name: f.type for f in fields(cls) if f.init}
+        values: dict[str, Any] = {
+            name: os.environ.get(name.upper(), configurable.get(name))
+            for name in field_types
+        }
+        # Environment variables are always strings, so cast to each field's type
+        return cls(**{k: field_types[k](v) for k, v in values.items() if v})
+
+
+# Model helpers
+@lru_cache(maxsize=8)
+def _get_model(model: str, model_provider: str) -> BaseChatModel:
+    """Return a chat model, built once per (model, provider) pair."""
+    return init_chat_model(model=model, model_provider=model_provider)
+
+
+@lru_cache(maxsize=8)
+def _get_structured_model(model: str, model_provider: str, schema: type[BaseModel]):
+    """Return a structured-output binding of the chat model, built once per schema."""
+    return _get_model(model, model_provider).with_structured_output(schema)
+
+
+# Progress helpers
+def _get_progress_callback(config: RunnableConfig):
+    """Return the optional progress_callback from the run config, tolerating a missing configurable."""
+    return (config.get("configurable") or {}).get("progress_callback")
+
+
+async def _send_progress(previous: Optional[asyncio.Task], progress_callback, *args) -> None:
+    """Deliver one progress update once the update queued before it has been delivered."""
+    if previous is not None and not previous.done():
+        await asyncio.wait([previous])
+    try:
+        await progress_callback(*args)
+    except Exception as e:
+        logger.warning("progress_callback failed: %s", e)
+
+
+def _release_progress(key: tuple[asyncio.AbstractEventLoop, str], task: asyncio.Task) -> None:
+    """Forget the run's send chain once its last queued update is done."""
+    if _progress_tails.get(key) is task:
+        del _progress_tails[key]
+
+
+def _emit(progress_callback, run_id: str, *args) -> None:
+    """Queue a progress update without waiting for the consumer to receive it.
+
+    Updates of the same run are chained, so they arrive in the order they were
+    emitted even though the research never waits on them. Separate runs get
+    separate chains, even when they share a callback.
+    """
+    if not progress_callback:
+        return
+    key = (asyncio.get_running_loop(), run_id)
+    task = asyncio.create_task(
+        _send_progress(_progress_tails.get(key), progress_callback, *args)
+    )
+    _progress_tails[key] = task
+    task.add_done_callback(lambda done: _release_progress(key, done))
+
+
+async def _drain_progress(run_id: str) -> None:
+    """Wait until every update queued for the run has been delivered."""
+    task = _progress_tails.get((asyncio.get_running_loop(), run_id))
+    if task is not None:
+        await asyncio.wait([task])
 
 
 # Node functions
 async def generate_initial_summary(state: SimpleReportState, config: RunnableConfig) -> Dict[str, Any]:
-    """Generate initial summary with 3 sections for the given topic."""
+    """Generate initial summary with the configured number of sections and their search queries."""
     
     topic = state["topic"]
+    configurable = SimpleWorkflowConfiguration.from_runnable_config(config)
+    number_of_sections = configurable.number_of_sections
+    number_of_queries = configurable.number_of_queries_per_section
     
-    # Initialize model
-    model = init_chat_model(
-        model="gpt-4o",
-        model_provider="openai"
+    system_prompt = simple_outline_instructions.format(
+        number_of_sections=number_of_sections,
+        number_of_queries=number_of_queries
     )
-    
-    system_prompt = """You are a research analyst. Given a topic, create an initial research outline with exactly 3 main sections.
-    
-For each section, provide:
-- A clear, descriptive title
-- A brief description of what should be covered in that section
 
-The 3 sections should provide comprehensive coverage of the topic from different angles or aspects."""
-
-    user_prompt = f"Create an initial research outline with 3 sections for the topic: {topic}"
+    user_prompt = f"Topic: {topic}"
     
-    structured_model = model.with_structured_output(InitialSections)
+    structured_model = _get_structured_model(configurable.model_name, configurable.model_provider, InitialSections)
     
     result = await structured_model.ainvoke([
         SystemMessage(content=system_prompt),
         HumanMessage(content=user_prompt)
     ])
     
-    # Convert to dictionary format
-    initial_sections = {
-        "Section 1": result.section_1,
-        "Section 2": result.section_2, 
-        "Section 3": result.section_3
-    }
+    plans = result.sections[:number_of_sections]
+    if not plans:
+        raise ValueError(f"No sections were planned for topic: {topic}")
+    if len(plans) < number_of_sections:
+        logger.warning("Planned %d of %d requested sections", len(plans), number_of_sections)
+    
+    # Convert to dictionary format, keyed by section title made unique
+    initial_sections = {}
+    section_queries = {}
+    for plan in plans:
+        section_name = plan.title
+        suffix = 2
+        while section_name in initial_sections:
+            section_name = f"{plan.title} ({suffix})"
+            suffix += 1
+        initial_sections[section_name] = plan.description
+        section_queries[section_name] = plan.queries[:number_of_queries]
     
-    return {"initial_sections": initial_sections}
+    return {
+        "initial_sections": initial_sections,
+        "section_queries": section_queries,
+        "progress_run_id": str(uuid.uuid4())
+    }
+
 
+async def batch_search(state: SimpleReportState, config: RunnableConfig) -> Command[Literal["process_section"]]:
+    """Run the search queries of all sections in one batch and fan the results out per section.
 
-def route_to_section_processing(state: SimpleReportState) -> List[Send]:
-    """Route each section to parallel processing."""
+    Sections without any sources are sent with empty content. DuckDuckGo reports
+    an empty search with its own message, which is passed through as content.
+    """
     
     topic = state["topic"]
     initial_sections = state["initial_sections"]
+    section_queries = state["section_queries"]
+    configurable = SimpleWorkflowConfiguration.from_runnable_config(config)
+    search_api = configurable.search_api
+    max_results = configurable.max_results_per_query
+    
+    section_content = {}
+    if search_api != "tavily":
+        # Other search APIs return pre-formatted output, so run one search per section
+        params_to_pass = get_search_params(
+            search_api, {MAX_RESULTS_PARAMS.get(search_api, "max_results"): max_results}
+        )
+        contents = await asyncio.gather(*[
+            select_and_execute_search(search_api, queries, params_to_pass)
+            for queries in section_queries.values()
+        ])
+        # A bare header means no sources came back; blank it so process_section skips the LLM
+        empty_content = deduplicate_and_format_sources([])
+        section_content = {
+            section_name: "" if content == empty_content else content
+            for section_name, content in zip(section_queries.keys(), contents)
+        }
+    else:
+        # Sections on one topic often repeat queries, so search each distinct query once
+        unique_queries = {}
+        for queries in section_queries.values():
+            for query in queries:
+                unique_queries.setdefault(query.strip().lower(), query)
+        
+        # Issue the distinct queries through a single Tavily batch
+        search_docs = await tavily_search_async(list(unique_queries.values()), max_results=max_results, include_raw_content=True)
+        docs_by_query = dict(zip(unique_queries.keys(), search_docs))
+        
+        # Map the responses back onto every section that asked for them
+        for section_name, queries in section_queries.items():
+            # Keep only the highest-scoring unique sources to bound the summary prompt
+            unique_sources = {}
+            for query in queries:
+                for source in docs_by_query[query.strip().lower()]["results"]:
+                    unique_sources.setdefault(source["url"], source)
+            top_sources = sorted(
+                unique_sources.values(), key=lambda source: source.get("score", 0), reverse=True
+            )[:configurable.max_sources_per_section]
+            if not top_sources:
+                section_content[section_name] = ""
+                continue
+            section_content[section_name] = deduplicate_and_format_sources(
+                [{"results": top_sources}], max_tokens_per_source=configurable.max_tokens_per_source
+            )
     
-    return [
+    # Kick off section processing in parallel via Send() API
+    return Command(goto=[
         Send("process_section", {
             "topic": topic,
             "section_name": section_name,
-            "section_description": description
+            "section_description": description,
+            "queries": section_queries[section_name],
+            "content": section_content[section_name],
+            "progress_run_id": state["progress_run_id"]
         })
         for section_name, description in initial_sections.items()
-    ]
+    ])
 
 
 async def process_section(state: SectionProcessingState, config: RunnableConfig) -> Dict[str, Any]:
-    """Process a single section: generate queries, retrieve content, create summary."""
+    """Process a single section: create a summary from its pre-fetched search results.
+
+    The summary is streamed from the model. If the run config carries an async
+    ``progress_callback(step, message, progress)`` under ``configurable``, the
+    streamed text is forwarded to it in batches of ``SUMMARY_STREAM_BATCH_SIZE``
+    chunks under the step ``writing:<section_name>``, so a consumer can tell
+    the concurrently streamed sections apart. Updates are queued in order
+    without being awaited, so a slow consumer never holds up the stream;
+    generate_final_report drains them.
+    """
     
     topic = state["topic"]
     section_name = state["section_name"]
     section_description = state["section_description"]
+    queries = state["queries"]
+    content = state["content"]
+    progress_callback = _get_progress_callback(config)
+    progress_run_id = state["progress_run_id"]
+    configurable = SimpleWorkflowConfiguration.from_runnable_config(config)
     
-    # Initialize model
-    model = init_chat_model(
-        model="gpt-4o",
-        model_provider="openai"
-    )
-    
-    # Step 1: Generate sub-queries for this section
-    query_system_prompt = """You are a research assistant. Generate specific search queries to gather comprehensive information for a research section.
-
-Generate 3 focused search queries that will help gather detailed information for the given section."""
-
-    query_user_prompt = f"""Topic: {topic}
-Section: {section_name}
-Description: {section_description}
-
-Generate 3 specific search queries for this section."""
-
-    structured_query_model = model.with_structured_output(SubQueries)
-    
-    query_result = await structured_query_model.ainvoke([
-        SystemMessage(content=query_system_prompt),
-        HumanMessage(content=query_user_prompt)
-    ])
-    
-    queries = query_result.queries
+    # Skip the summary call when the search came back empty
+    if not content.strip():
+        empty_result: SectionResult = {
+            "section_name": section_name,
+            "queries": queries,
+            "summary": f"No search results were found for {section_name}."
+        }
+        return {"section_results": {section_name: empty_result}}
     
-    # Step 2: Retrieve content using Tavily search
-    search_params = {"max_results": 5}
-    content = await select_and_execute_search("tavily", queries, search_params)
+    model = _get_model(configurable.model_name, configurable.model_provider)
     
-    # Step 3: Create detailed summary based on retrieved content
-    summary_system_prompt = """You are a research analyst. Create a comprehensive, detailed summary for a research section based on the provided search results.
-
-The summary should:
-- Be well-structured and informative
-- Include key facts, insights, and relevant details from the search results
-- Be substantial enough to stand as a complete section in a research report
-- Maintain objectivity and cite important findings"""
-
+    # Create detailed summary based on retrieved content
     summary_user_prompt = f"""Section: {section_name}
 Description: {section_description}
 Topic Context: {topic}
 
 Search Results:
-{content}
-
-Create a detailed summary for this section based on the search results above."""
+{content}"""
 
-    summary_result = await model.ainvoke([
-        SystemMessage(content=summary_system_prompt),
+    # Stream the summary, forwarding it to the callback in small batches
+    summary_chunks = []
+    pending_chunks = []
+    async for chunk in model.astream([
+        SystemMessage(content=simple_section_summary_instructions),
         HumanMessage(content=summary_user_prompt)
-    ])
+    ]):
+        summary_chunks.append(chunk.content)
+        pending_chunks.append(chunk.content)
+        if len(pending_chunks) >= SUMMARY_STREAM_BATCH_SIZE:
+            _emit(progress_callback, progress_run_id, f"writing:{section_name}", "".join(pending_chunks), 60)
+            pending_chunks = []
+    if pending_chunks:
+        _emit(progress_callback, progress_run_id, f"writing:{section_name}", "".join(pending_chunks), 60)
     
-    # Return a single section result that will be added to the list
+    # Return a single section result that will be merged into the dict
     section_result: SectionResult = {
         "section_name": section_name,
         "queries": queries,
-        "content": content,
-        "summary": summary_result.content
+        "summary": "".join(summary_chunks)
     }
     
-    return {"section_results": [section_result]}
+    return {"section_results": {section_name: section_result}}
 
 
 async def generate_final_report(state: SimpleReportState, config: RunnableConfig) -> Dict[str, Any]:
-    """Generate the final comprehensive report."""
+    """Generate the final comprehensive report.
+
+    The model only writes the title, executive summary and conclusion; the
+    section summaries are assembled into the report as-is. If the run config
+    carries an async ``progress_callback(step, message, progress)`` under
+    ``configurable``, it is notified once the report is ready.
+    """
     
     topic = state["topic"]
     section_results = state["section_results"]
+    progress_callback = _get_progress_callback(config)
+    progress_run_id = state["progress_run_id"]
+    configurable = SimpleWorkflowConfiguration.from_runnable_config(config)
     
-    # Initialize model
-    model = init_chat_model(
-        model="gpt-4o",
-        model_provider="openai"
-    )
+    structured_model = _get_structured_model(configurable.model_name, configurable.model_provider, ReportShell)
     
-    # Prepare section content for the final report
-    sections_text = ""
-    for section_result in section_results:
-        section_name = section_result["section_name"]
-        summary = section_result["summary"]
-        sections_text += f"\n\n## {section_name}\n{summary}"
+    # Prepare section content in outline order, since branches finish in any order
+    sections_text = "".join(
+        f"\n\n## {section_name}\n{section_results[section_name]['summary']}"
+        for section_name in state["initial_sections"]
+        if section_name in section_results
+    )
     
-    system_prompt = """You are a professional report writer. Create a comprehensive final report that includes:
-
-1. A compelling title for the report
-2. An executive summary that captures the key insights
-3. The detailed sections (already provided)
-4. A conclusion that synthesizes the findings and provides final thoughts
-
-The report should be well-structured, professional, and provide valuable insights on the topic."""
-
     user_prompt = f"""Topic: {topic}
 
-Detailed Sections:{sections_text}
-
-Create a final comprehensive report with:
-- Title
-- Executive Summary  
-- The sections above (keep them as-is)
-- Conclusion
+Detailed Sections:{sections_text}"""
 
-Format this as a complete, professional report."""
-
-    final_result = await model.ainvoke([
-        SystemMessage(content=system_prompt),
+    shell = await structured_model.ainvoke([
+        SystemMessage(content=simple_final_report_instructions),
         HumanMessage(content=user_prompt)
     ])
     
-    return {"final_report": final_result.content}
+    # Assemble the report around the unmodified section summaries
+    final_report = (
+        f"# {shell.title}\n\n"
+        f"## Executive Summary\n{shell.executive_summary}"
+        f"{sections_text}\n\n"
+        f"## Conclusion\n{shell.conclusion}"
+    )
+    
+    # Deliver the queued updates before the run returns and its loop can close
+    _emit(progress_callback, progress_run_id, "final_report", "Final report generated", 100)
+    await _drain_progress(progress_run_id)
+    
+    return {"final_report": final_report}
 
 
 # Build the graph
-def create_simple_research_graph():
-    """Create the simple research workflow graph."""
+def create_simple_research_graph(checkpointer: Optional[BaseCheckpointSaver] = None):
+    """Create the simple research workflow graph.
+
+    The graph is compiled without a checkpointer by default, since a single-shot
+    run has no need to persist state between nodes. Pass a checkpointer to make
+    runs resumable. Section branches run concurrently; cap them per run with
+    the standard ``max_concurrency`` config key.
+    """
     
     # Create the graph
     builder = StateGraph(SimpleReportState, config_schema=SimpleWorkflowConfiguration)
     
     # Add nodes
     builder.add_node("generate_initial_summary", generate_initial_summary)
+    builder.add_node("batch_search", batch_search)
     builder.add_node("process_section", process_section)
     builder.add_node("generate_final_report", generate_final_report)
     
     # Add edges
     builder.add_edge(START, "generate_initial_summary")
-    builder.add_conditional_edges(
-        "generate_initial_summary",
-        route_to_section_processing,
-        ["process_section"]
-    )
+    builder.add_edge("generate_initial_summary", "batch_search")
     builder.add_edge("process_section", "generate_final_report")
     builder.add_edge("generate_final_report", END)
     
-    return builder.compile()
+    return builder.compile(checkpointer=checkpointer)
 
 
 # Create the graph instance
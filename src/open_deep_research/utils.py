@@ -6,6 +6,7 @@ import requests
 import random 
 import concurrent
 import hashlib
+import logging
 import aiohttp
 import httpx
 import time
@@ -42,6 +43,8 @@ from open_deep_research.configuration import Configuration
 from open_deep_research.state import Section
 from open_deep_research.prompts import SUMMARIZATION_PROMPT
 
+logger = logging.getLogger(__name__)
+
 
 def get_config_value(value):
     """
@@ -1519,7 +1522,13 @@ async def select_and_execute_search(search_api: str, query_list: list[str], para
         # DuckDuckGo search tool used with both workflow and agent 
         return await duckduckgo_search.ainvoke({'search_queries': query_list})
     elif search_api == "perplexity":
-        search_results = perplexity_search(query_list, **params_to_pass)
+        # perplexity_search is synchronous, so run each query in a worker thread
+        # to keep the event loop free and let the requests overlap
+        per_query_results = await asyncio.gather(*[
+            asyncio.to_thread(perplexity_search, [query], **params_to_pass)
+            for query in query_list
+        ])
+        search_results = [doc for docs in per_query_results for doc in docs]
     elif search_api == "exa":
         search_results = await exa_search(query_list, **params_to_pass)
     elif search_api == "arxiv":
@@ -1558,8 +1567,9 @@ async def summarize_webpage(model: BaseChatModel, webpage_content: str) -> str:
             {"role": "system", "content": SUMMARIZATION_PROMPT.format(webpage_content=webpage_content)},
             {"role": "user", "content": user_input_content},
         ])
-    except:
+    except Exception as e:
         # fall back on the raw content
+        logger.warning("Webpage summarization failed, using raw content: %s", e)
         return webpage_content
 
     def format_summary(summary: Summary):
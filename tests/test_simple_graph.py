@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from open_deep_research import simple_graph
+from open_deep_research.simple_graph import (
+    InitialSections,
+    ReportShell,
+    SectionPlan,
+    SimpleWorkflowConfiguration,
+    batch_search,
+    generate_final_report,
+    generate_initial_summary,
+    process_section,
+)
+from open_deep_research.utils import deduplicate_and_format_sources
+
+
+class FakeStructuredModel:
+    """Stand-in for a structured-output model that returns a fixed response."""
+
+    def __init__(self, response):
+        self.response = response
+
+    async def ainvoke(self, messages):
+        return self.response
+
+
+def make_source(url, score):
+    return {"title": f"Title {url}", "url": url, "content": f"Content {url}", "score": score, "raw_content": None}
+
+
+@pytest.fixture
+def search_calls(monkeypatch):
+    """Stub tavily_search_async with canned results and record each batch of queries."""
+    calls = []
+    results = {
+        "AI chips": [make_source("https://a.com", 0.9), make_source("https://b.com", 0.2)],
+        "chip supply": [make_source("https://a.com", 0.9), make_source("https://c.com", 0.5)],
+        "no hits": [],
+    }
+
+    async def fake_tavily_search_async(queries, **kwargs):
+        calls.append(list(queries))
+        return [{"query": query, "results": results[query]} for query in queries]
+
+    monkeypatch.setattr(simple_graph, "tavily_search_async", fake_tavily_search_async)
+    return calls
+
+
+def run_batch_search(section_queries, **configurable):
+    state = {
+        "topic": "Semiconductors",
+        "initial_sections": {name: f"About {name}" for name in section_queries},
+        "section_queries": section_queries,
+        "progress_run_id": "run-1",
+    }
+    command = asyncio.run(batch_search(state, {"configurable": {"search_api": "tavily", **configurable}}))
+    return {send.arg["section_name"]: send.arg for send in command.goto}
+
+
+def test_batch_search_searches_each_normalized_query_once(search_calls):
+    run_batch_search({
+        "Market": ["AI chips", "chip supply"],
+        "Supply": [" ai CHIPS ", "chip supply"],
+    })
+
+    assert search_calls == [["AI chips", "chip supply"]]
+
+
+def test_batch_search_keeps_top_unique_sources_per_section(search_calls):
+    payloads = run_batch_search({"Market": ["AI chips", "chip supply"]}, max_sources_per_section=2)
+
+    content = payloads["Market"]["content"]
+    assert content.count("Title https://a.com") == 1
+    assert "Title https://c.com" in content
+    assert "Title https://b.com" not in content
+
+
+def test_batch_search_sends_empty_content_without_sources(search_calls):
+    payloads = run_batch_search({"Market": ["AI chips"], "Gaps": ["no hits"]})
+
+    assert list(payloads) == ["Market", "Gaps"]
+    assert payloads["Gaps"]["content"] == ""
+    assert payloads["Gaps"]["queries"] == ["no hits"]
+
+
+def test_batch_search_blanks_empty_results_from_other_apis(monkeypatch):
+    async def fake_select_and_execute_search(search_api, queries, params):
+        sources = [make_source("https://a.com", 0.9)] if queries == ["AI chips"] else []
+        return deduplicate_and_format_sources([{"results": sources}])
+
+    monkeypatch.setattr(simple_graph, "select_and_execute_search", fake_select_and_execute_search)
+
+    payloads = run_batch_search({"Market": ["AI chips"], "Gaps": ["no hits"]}, search_api="exa")
+
+    assert "Title https://a.com" in payloads["Market"]["content"]
+    assert payloads["Gaps"]["content"] == ""
+
+
+@pytest.mark.parametrize("search_api, expected_params", [
+    ("exa", {"num_results": 7}),
+    ("arxiv", {"load_max_docs": 7}),
+    ("pubmed", {"top_k_results": 7}),
+    ("googlesearch", {"max_results": 7}),
+    ("linkup", {}),
+])
+def test_batch_search_maps_max_results_to_each_api(monkeypatch, search_api, expected_params):
+    calls = []
+
+    async def fake_select_and_execute_search(search_api, queries, params):
+        calls.append(params)
+        return "Content"
+
+    monkeypatch.setattr(simple_graph, "select_and_execute_search", fake_select_and_execute_search)
+
+    run_batch_search({"Market": ["AI chips"]}, search_api=search_api, max_results_per_query=7)
+
+    assert calls == [expected_params]
+
+
+def test_initial_summary_makes_titles_unique_and_caps_count(monkeypatch):
+    plan = InitialSections(sections=[
+        SectionPlan(title=title, description=f"About {title}", queries=[f"{title} query"])
+        for title in ["Overview", "Overview", "Impact", "Extra"]
+    ])
+    monkeypatch.setattr(simple_graph, "_get_structured_model", lambda *args: FakeStructuredModel(plan))
+
+    result = asyncio.run(generate_initial_summary(
+        {"topic": "Semiconductors"}, {"configurable": {"number_of_sections": 3}}
+    ))
+
+    assert list(result["initial_sections"]) == ["Overview", "Overview (2)", "Impact"]
+    assert list(result["section_queries"]) == ["Overview", "Overview (2)", "Impact"]
+
+
+def test_initial_summary_caps_queries_per_section(monkeypatch):
+    plan = InitialSections(sections=[
+        SectionPlan(title="Overview", description="About Overview", queries=[f"query {i}" for i in range(10)])
+    ])
+    monkeypatch.setattr(simple_graph, "_get_structured_model", lambda *args: FakeStructuredModel(plan))
+
+    result = asyncio.run(generate_initial_summary(
+        {"topic": "Semiconductors"}, {"configurable": {"number_of_sections": 1, "number_of_queries_per_section": 2}}
+    ))
+
+    assert result["section_queries"] == {"Overview": ["query 0", "query 1"]}
+
+
+def test_initial_summary_rejects_empty_plan(monkeypatch):
+    plan = InitialSections(sections=[])
+    monkeypatch.setattr(simple_graph, "_get_structured_model", lambda *args: FakeStructuredModel(plan))
+
+    with pytest.raises(ValueError):
+        asyncio.run(generate_initial_summary({"topic": "Semiconductors"}, {"configurable": {}}))
+
+
+def test_final_report_follows_outline_order_and_drains_progress(monkeypatch):
+    shell = ReportShell(title="Chips", executive_summary="Summary", conclusion="Done")
+    monkeypatch.setattr(simple_graph, "_get_structured_model", lambda *args: FakeStructuredModel(shell))
+    received = []
+
+    async def progress_callback(step, message, progress):
+        await asyncio.sleep(0.01)
+        received.append(step)
+
+    state = {
+        "topic": "Semiconductors",
+        "initial_sections": {"Market": "", "Supply": ""},
+        # Branches finish in any order, so results arrive out of outline order
+        "section_results": {
+            "Supply": {"section_name": "Supply", "queries": [], "summary": "Supply text"},
+            "Market": {"section_name": "Market", "queries": [], "summary": "Market text"},
+        },
+        "progress_run_id": "run-1",
+    }
+
+    async def run():
+        # Updates queued by earlier nodes must arrive before the final one
+        simple_graph._emit(progress_callback, "run-1", "writing:Market", "text", 60)
+        return await generate_final_report(state, {"configurable": {"progress_callback": progress_callback}})
+
+    report = asyncio.run(run())["final_report"]
+
+    assert report.index("## Market") < report.index("## Supply")
+    assert report.startswith("# Chips\n\n## Executive Summary\nSummary")
+    assert report.endswith("## Conclusion\nDone")
+    assert received == ["writing:Market", "final_report"]
+
+
+def test_concurrent_runs_sharing_a_callback_drain_independently(monkeypatch):
+    shell = ReportShell(title="Chips", executive_summary="Summary", conclusion="Done")
+    monkeypatch.setattr(simple_graph, "_get_structured_model", lambda *args: FakeStructuredModel(shell))
+    received = []
+
+    async def progress_callback(step, message, progress):
+        # Only the slow run's consumer lags
+        if message == "slow":
+            await asyncio.sleep(1)
+        received.append((step, message))
+
+    def make_state(run_id):
+        return {"topic": "Semiconductors", "initial_sections": {}, "section_results": {}, "progress_run_id": run_id}
+
+    async def run():
+        config = {"configurable": {"progress_callback": progress_callback}}
+        simple_graph._emit(progress_callback, "slow-run", "writing:Market", "slow", 60)
+        slow = asyncio.create_task(generate_final_report(make_state("slow-run"), config))
+        await generate_final_report(make_state("fast-run"), config)
+        # The fast run finished without waiting behind the slow run's consumer
+        assert received == [("final_report", "Final report generated")]
+        await slow
+
+    asyncio.run(run())
+
+    assert received[1:] == [("writing:Market", "slow"), ("final_report", "Final report generated")]
+
+
+def test_runs_on_separate_event_loops_do_not_share_a_chain(monkeypatch):
+    shell = ReportShell(title="Chips", executive_summary="Summary", conclusion="Done")
+    monkeypatch.setattr(simple_graph, "_get_structured_model", lambda *args: FakeStructuredModel(shell))
+
+    async def progress_callback(step, message, progress):
+        await asyncio.sleep(0.05)
+
+    def run():
+        state = {"topic": "Semiconductors", "initial_sections": {}, "section_results": {}, "progress_run_id": "same-run"}
+        asyncio.run(generate_final_report(state, {"configurable": {"progress_callback": progress_callback}}))
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads)
+
+
+class FakeStreamingModel:
+    """Stand-in for a chat model that streams a fixed list of chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        for text in self.chunks:
+            yield SimpleNamespace(content=text)
+
+
+def make_section_state(content):
+    return {
+        "topic": "Semiconductors",
+        "section_name": "Market",
+        "section_description": "About Market",
+        "queries": ["AI chips"],
+        "content": content,
+        "progress_run_id": "run-1",
+    }
+
+
+def test_process_section_streams_summary_in_batches(monkeypatch):
+    chunks = [f"{i} " for i in range(simple_graph.SUMMARY_STREAM_BATCH_SIZE + 4)]
+    monkeypatch.setattr(simple_graph, "_get_model", lambda *args: FakeStreamingModel(chunks))
+    received = []
+
+    async def progress_callback(step, message, progress):
+        received.append((step, message))
+
+    async def run():
+        result = await process_section(make_section_state("Search results"), {"configurable": {"progress_callback": progress_callback}})
+        await simple_graph._drain_progress("run-1")
+        return result
+
+    result = asyncio.run(run())
+
+    assert result["section_results"]["Market"]["summary"] == "".join(chunks)
+    assert received == [
+        ("writing:Market", "".join(chunks[:simple_graph.SUMMARY_STREAM_BATCH_SIZE])),
+        ("writing:Market", "".join(chunks[simple_graph.SUMMARY_STREAM_BATCH_SIZE:])),
+    ]
+
+
+def test_process_section_skips_model_without_content(monkeypatch):
+    model = FakeStreamingModel(["unused"])
+    monkeypatch.setattr(simple_graph, "_get_model", lambda *args: model)
+
+    result = asyncio.run(process_section(make_section_state("  "), {"configurable": {}}))
+
+    assert model.calls == 0
+    assert result["section_results"]["Market"]["summary"] == "No search results were found for Market."
+
+
+def test_configuration_casts_environment_values(monkeypatch):
+    monkeypatch.setenv("MAX_SOURCES_PER_SECTION", "3")
+    monkeypatch.setenv("MODEL_NAME", "gpt-4o-mini")
+
+    configurable = SimpleWorkflowConfiguration.from_runnable_config({"configurable": {"number_of_sections": 4}})
+
+    assert configurable.max_sources_per_section == 3
+    assert configurable.number_of_sections == 4
+    assert configurable.model_name == "gpt-4o-mini"